@@ -1,22 +1,58 @@
+import io
 import os
+import re
+import mmap
+import fcntl
 import shutil
-import subprocess
+import socket
+import selectors
 import zipfile
 import uuid
-import json
+import time
+import hashlib
+import tempfile
+import asyncio
+import threading
+import importlib.metadata
+
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Optional
 
 import docker
+import msgspec
+import orjson
+
+from docker.utils.socket import frames_iter
+
+from cachetools import TTLCache
 
-from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.responses import HTMLResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, Preformatted, SimpleDocTemplate, Spacer
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # older python-multipart releases
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
 
 app = FastAPI()
 
-# Docker client (to run scanner containers)
-docker_client = docker.from_env()
+# Docker client (to run scanner containers). One shared client whose
+# urllib3 pool holds enough keep-alive sockets for every concurrent scan —
+# the API client is thread-safe, so pooled connections beat a client per
+# caller both in socket churn and daemon-side session count.
+docker_client = docker.from_env(timeout=60, max_pool_size=32)
+
+
+def _pick_client():
+    return docker_client
 
 # -----------------------------
 # Static & Templates
@@ -30,146 +66,1517 @@ templates = Jinja2Templates(directory="templates")
 UPLOAD_DIR = "/tmp/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Ports we probe when looking for the web UI of a built target
+COMMON_WEB_PORTS = [80, 8000, 5000, 3000]
+
+# Directories we never want to descend into while walking a project
+IGNORE_DIRS = {".git", "node_modules", "venv", ".venv", "__pycache__", "target", "dist"}
+
+# Directories the scanners themselves should never descend into; most
+# findings there are vendored noise that dominates runtime and output size.
+SCAN_SKIP_DIRS = os.environ.get(
+    "SCAN_SKIP_DIRS", ".git,node_modules,venv,.venv,target,dist,__pycache__"
+)
+
+# bandit additionally skips test code — not what we are grading
+BANDIT_SKIP_DIRS = SCAN_SKIP_DIRS + ",tests,test"
+
+# The pipeline steps, in display order
+PIPELINE_STEPS = ["bandit", "gitleaks", "trivy", "dast"]
+
+# Archive entries under these prefixes are never worth extracting:
+# the scanners either skip them or drown in them.
+EXTRACT_SKIP_PREFIXES = frozenset({".git/", "node_modules/", "__pycache__/"})
+
+# Refuse to extract single members larger than this (decompressed)
+MAX_MEMBER_SIZE = int(os.environ.get("MAX_MEMBER_SIZE", 512 * 1024 * 1024))
+
+# Members up to this size are extracted with a single write(2)
+SMALL_MEMBER_SIZE = 1 << 20
+
+# Uploads under this size are kept in memory end to end: the archive is
+# parsed and extracted without ever being written to disk.
+SMALL_UPLOAD_LIMIT = int(os.environ.get("SMALL_UPLOAD_LIMIT", 32 * 1024 * 1024))
+
+# Scanner output beyond this parses in the CPU pool, off the GIL
+PARSE_OFFLOAD_LIMIT = 4 * 1024 * 1024
+
+# CPU-bound work (large JSON decode, scoring) runs here so it never holds
+# the GIL against the event loop serving /scan-status polls.
+CPU_POOL = ProcessPoolExecutor(max_workers=max(2, (os.cpu_count() or 2) // 2))
+
+
+def _loads_maybe_offload(buf):
+    """orjson.loads, shipped to the CPU pool when the buffer is large."""
+    if len(buf) > PARSE_OFFLOAD_LIMIT:
+        return CPU_POOL.submit(orjson.loads, buf).result()
+    return orjson.loads(buf)
 
 # -----------------------------
-# Home Page
+# Scan result cache
 # -----------------------------
-@app.get("/", response_class=HTMLResponse)
-async def home(request: Request):
-    return templates.TemplateResponse(
-        "index.html",
-        {"request": request}
+# Results are content-addressed on (scanner, scanner version, zip sha256),
+# so re-uploading the same archive skips the scan entirely.
+CACHE_DIR = "/tmp/scan-cache"
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+try:
+    BANDIT_VERSION = importlib.metadata.version("bandit")
+except importlib.metadata.PackageNotFoundError:
+    BANDIT_VERSION = "unknown"
+
+
+def _cache_path(key):
+    # image ids look like "sha256:abc..." — keep keys filesystem-safe
+    return os.path.join(CACHE_DIR, key.replace(":", "_").replace("/", "_") + ".json")
+
+
+def _cache_get(key):
+    try:
+        with open(_cache_path(key), "rb") as fh:
+            return orjson.loads(fh.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+def _cache_put(key, result):
+    path = _cache_path(key)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(orjson.dumps(result))
+    os.replace(tmp, path)
+
+
+def _cached(key, fn):
+    """Return the cached result for key, or compute and store it.
+
+    An flock on a sibling .lock file coalesces concurrent identical scans:
+    the first caller runs the scanner, everyone else blocks and then reads
+    the freshly written cache entry.
+    """
+    hit = _cache_get(key)
+    if hit is not None:
+        return hit
+
+    with open(_cache_path(key) + ".lock", "w") as lock_fh:
+        fcntl.flock(lock_fh, fcntl.LOCK_EX)
+        hit = _cache_get(key)
+        if hit is not None:
+            return hit
+
+        result = fn()
+        # don't poison the cache with transient failures
+        if not (isinstance(result, dict) and "error" in result):
+            _cache_put(key, result)
+        return result
+
+
+def _image_key(image):
+    """Image id for cache keys, so image upgrades invalidate automatically."""
+    digest = IMAGE_DIGESTS.get(image)
+    if digest:
+        return digest
+    try:
+        return docker_client.images.get(image).id
+    except Exception:
+        return image
+
+
+# -----------------------------
+# Scanner image pre-pull
+# -----------------------------
+# Pull everything the pipeline needs while the app boots, so the first scan
+# after a deploy pays scan time only — not a 30s cold image pull.
+SCANNER_IMAGES = [
+    "zricethezav/gitleaks:latest",
+    "aquasec/trivy:latest",
+    "owasp/zap2docker-stable",
+]
+
+IMAGE_DIGESTS = {}
+_images_ready = threading.Event()
+
+
+def _pull_scanner_images():
+    def pull(image):
+        try:
+            img = docker_client.images.pull(image)
+        except Exception:
+            try:
+                img = docker_client.images.get(image)
+            except Exception:
+                return
+        IMAGE_DIGESTS[image] = img.id
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(pull, SCANNER_IMAGES))
+    _images_ready.set()
+
+
+# -----------------------------
+# Warm scanner workers
+# -----------------------------
+# One long-lived container per Docker-based scanner, with the uploads dir
+# mounted read-only. Each scan execs into it instead of paying container
+# create/start/remove (namespaces, cgroups, mounts) per invocation.
+WORKER_IMAGES = {
+    "gitleaks": "zricethezav/gitleaks:latest",
+    "trivy": "aquasec/trivy:latest",
+}
+
+_worker_lock = threading.Lock()
+
+# gitleaks takes its exclusions from a config file; write it once into the
+# uploads dir, which the worker sees at /uploads.
+GITLEAKS_CONFIG_PATH = os.path.join(UPLOAD_DIR, "gitleaks.toml")
+
+
+def _write_gitleaks_config():
+    allow = ",\n".join(
+        f"    '^{re.escape(d)}/'" for d in SCAN_SKIP_DIRS.split(",") if d
     )
+    with open(GITLEAKS_CONFIG_PATH, "w") as fh:
+        fh.write(f"title = \"scanner allowlist\"\n\n[allowlist]\npaths = [\n{allow},\n]\n")
+
+
+_write_gitleaks_config()
+
+
+def _ensure_worker(tool, client):
+    """Get the warm worker for tool, (re)creating it if missing or dead."""
+    name = f"{tool}-worker"
+    with _worker_lock:
+        try:
+            worker = client.containers.get(name)
+            if worker.status == "running":
+                return worker
+            worker.remove(force=True)
+        except docker.errors.NotFound:
+            pass
+        except Exception:
+            pass
+
+        return client.containers.run(
+            WORKER_IMAGES[tool],
+            "infinity",
+            entrypoint="sleep",
+            detach=True,
+            name=name,
+            volumes={
+                UPLOAD_DIR: {"bind": "/uploads", "mode": "ro"}
+            },
+        )
+
 
+def _worker_exec(tool, cmd):
+    """Exec cmd in the warm worker, restarting it once if it has died.
+
+    Returns (exit_code, stdout bytes): callers must check the code, since
+    a failed scanner with empty stdout is otherwise indistinguishable
+    from a clean report.
+    """
+    client = _pick_client()
+    for attempt in (0, 1):
+        worker = _ensure_worker(tool, client)
+        try:
+            code, output = worker.exec_run(cmd, stdout=True, stderr=False)
+            return code, output
+        except docker.errors.APIError:
+            if attempt:
+                raise
+            try:
+                worker.remove(force=True)
+            except Exception:
+                pass
 
 # -----------------------------
-# Scan Endpoint
+# In-memory scan state
 # -----------------------------
-@app.post("/scan", response_class=HTMLResponse)
-async def scan_code(request: Request, file: UploadFile = File(...)):
+# scan_id -> state dict; mutated by the pipeline task and its worker
+# threads, read by the status endpoint. The TTL cache bounds memory:
+# forgotten scans age out instead of accumulating forever.
+SCAN_TTL = 3600
+SCAN_STATE = TTLCache(maxsize=1024, ttl=SCAN_TTL)
+_state_lock = threading.RLock()
 
-    # Create unique scan folder
-    scan_id = str(uuid.uuid4())
-    project_path = os.path.join(UPLOAD_DIR, scan_id)
-    os.makedirs(project_path, exist_ok=True)
+# Strong refs to in-flight pipeline tasks (asyncio only holds weak ones)
+_TASKS = {}
 
-    zip_path = os.path.join(project_path, "code.zip")
 
-    # Save uploaded file
-    with open(zip_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+class StepState(msgspec.Struct):
+    status: str = "pending"
+    start: Optional[float] = None
+    end: Optional[float] = None
+    duration: float = 0.0
+    result_path: Optional[str] = None
 
-    # Extract ZIP safely
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(project_path)
-    except zipfile.BadZipFile:
-        return templates.TemplateResponse(
-            "index.html",
-            {
-                "request": request,
-                "results": {"error": "Invalid ZIP file"}
-            }
+
+class ScanState(msgspec.Struct):
+    project_path: str
+    current: str = "upload"
+    progress: int = 0
+    sha256: Optional[str] = None
+    score: Optional[int] = None
+    error: Optional[str] = None
+    cancelled: bool = False
+    steps: dict = {}
+    containers: list = []
+
+
+class StatusView(msgspec.Struct):
+    """The subset of ScanState the status endpoint exposes."""
+    current: str
+    progress: int
+    sha256: Optional[str]
+    score: Optional[int]
+    error: Optional[str]
+    cancelled: bool
+    steps: dict
+
+
+def init_scan(scan_id, project_path, sha256=None):
+    with _state_lock:
+        SCAN_STATE[scan_id] = ScanState(
+            project_path=project_path,
+            sha256=sha256,
+            steps={name: StepState() for name in PIPELINE_STEPS},
         )
 
-    results = {}
 
-    # =====================================================
-    # 1️⃣ Run Bandit (Local Python SAST)
-    # =====================================================
-    bandit_proc = subprocess.run(
-        ["bandit", "-r", project_path, "-f", "json", "--quiet"],
-        capture_output=True,
-        text=True
-    )
+def _reap_stale_uploads():
+    """Delete upload dirs older than the scan TTL.
+
+    Keyed off directory mtime rather than SCAN_STATE so disk gets cleaned
+    even after the cache has already evicted the entry.
+    """
+    while True:
+        time.sleep(60)
+        cutoff = time.time() - SCAN_TTL
+        try:
+            with os.scandir(UPLOAD_DIR) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+threading.Thread(target=_reap_stale_uploads, daemon=True).start()
 
-    raw_output = bandit_proc.stdout
-    json_start = raw_output.find("{")
-    cleaned_output = raw_output[json_start:] if json_start != -1 else raw_output
 
+# =====================================================
+# Archive extraction
+# =====================================================
+def _should_extract(name):
+    """Filter out junk paths and anything trying to escape the scan dir."""
+    if name.endswith("/"):
+        return False
+    # normalize so "foo/node_modules/bar" is caught, not just top-level
+    parts = name.split("/")
+    for i in range(len(parts) - 1):
+        if parts[i] + "/" in EXTRACT_SKIP_PREFIXES:
+            return False
+    return True
+
+
+class _MappedReader(io.RawIOBase):
+    """File-like view of an mmap for ZipFile.
+
+    mmap itself only grew seekable() in Python 3.13, and ZipFile probes
+    for it; delegating through RawIOBase supplies the full io protocol
+    while reads stay memcpy from the mapping.
+    """
+
+    def __init__(self, mm):
+        self._mm = mm
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._mm.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        self._mm.seek(pos, whence)
+        return self._mm.tell()
+
+    def tell(self):
+        return self._mm.tell()
+
+
+def extract_zip(zip_source, project_path):
+    """Stream wanted members out of the archive instead of extractall.
+
+    Extracting member-by-member lets the first scanner-relevant file hit
+    disk without waiting on junk directories, and skipping those outright
+    keeps the on-disk tree (and every downstream scan) small.
+
+    zip_source is either the archive bytes (small uploads that never hit
+    disk) or a path. On-disk archives are read through an mmap of the
+    file: the central-directory parse (a storm of tiny seek+read calls on
+    a plain file object) is served straight from page cache, and member
+    reads become memcpy from the mapping. The mapping goes through
+    _MappedReader so ZipFile gets a real io object — no BytesIO copy of
+    the archive is ever made.
+    """
+    if isinstance(zip_source, (bytes, bytearray)):
+        if not zip_source:
+            raise zipfile.BadZipFile("File is empty")
+        with zipfile.ZipFile(io.BytesIO(zip_source)) as z:
+            _extract_members(z, project_path)
+        return
+
+    if os.path.getsize(zip_source) == 0:
+        raise zipfile.BadZipFile("File is empty")
+
+    with open(zip_source, "rb") as fh, \
+            mmap.mmap(fh.fileno(), 0, prot=mmap.PROT_READ) as mm:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+
+        reader = io.BufferedReader(_MappedReader(mm), buffer_size=1 << 20)
+        with zipfile.ZipFile(reader) as z:
+            _extract_members(z, project_path)
+
+    # Reclaim the archive's disk space before the scanners fan out
+    os.remove(zip_source)
+
+
+def _extract_members(z, project_path):
+    for info in z.infolist():
+        if not _should_extract(info.filename):
+            continue
+        if info.file_size > MAX_MEMBER_SIZE:
+            continue
+
+        target = os.path.join(project_path, info.filename)
+        # guard against ../ traversal in hostile archives
+        if not os.path.realpath(target).startswith(os.path.realpath(project_path) + os.sep):
+            continue
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # Source trees are overwhelmingly small files; decompress those
+        # in one shot and write them with a single write(2) instead of
+        # paying open/buffered-loop/close bookkeeping per 1 MiB chunk.
+        if info.file_size <= SMALL_MEMBER_SIZE:
+            data = z.read(info)
+            fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        else:
+            with z.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, length=1 << 20)
+
+
+# =====================================================
+# Project introspection helpers
+# =====================================================
+def detect_project_type(path):
+    """Return ("compose", path) / ("dockerfile", path) / ("unknown", None).
+
+    Breadth-first os.scandir walk: dirent types come for free (no stat per
+    entry), junk directories are pruned before they are ever opened, and the
+    walk stops the moment a compose file turns up since compose wins anyway.
+    """
+    dockerfile_path = None
+    queue = deque([path])
+
+    while queue:
+        current = queue.popleft()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in IGNORE_DIRS:
+                            queue.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        if entry.name in ("docker-compose.yml", "docker-compose.yaml"):
+                            return "compose", entry.path
+                        if entry.name == "Dockerfile" and dockerfile_path is None:
+                            dockerfile_path = entry.path
+        except OSError:
+            continue
+
+    if dockerfile_path:
+        return "dockerfile", dockerfile_path
+    return "unknown", None
+
+
+def _iter_tree(base, ignore=IGNORE_DIRS):
+    """Yield (dirpath, filenames) breadth-first via os.scandir.
+
+    Unlike os.walk this never stats an entry — dirent types come for free —
+    and ignored directories are pruned before they are ever opened, so a
+    repo full of node_modules costs one readdir, not thousands of stats.
+    Breadth-first order means shallower directories always come out first.
+    """
+    queue = deque([base])
+    while queue:
+        current = queue.popleft()
+        files = []
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in ignore:
+                            queue.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append(entry.name)
+        except OSError:
+            continue
+        yield current, files
+
+
+def detect_all_targets(path):
+    """Find every directory in the tree that contains a Dockerfile."""
+    return [root for root, files in _iter_tree(path) if "Dockerfile" in files]
+
+
+def find_env_file(base_path):
+    """Find the shallowest .env file under base_path, if any.
+
+    _iter_tree is breadth-first, so the first hit is already the shallowest
+    — return it immediately instead of scanning the rest of the repo.
+    """
+    for root, files in _iter_tree(base_path):
+        if ".env" in files:
+            return os.path.join(root, ".env")
+    return None
+
+
+# One match per KEY=VALUE line, comments excluded, with the value in
+# whichever group matched: double-quoted, single-quoted, or bare.
+# [^\S\r\n] is horizontal whitespace: plain \s would greedily eat the
+# newline after an empty value and swallow the following line.
+ENV_RE = re.compile(
+    rb"^(?!#)[^\S\r\n]*([A-Za-z_][A-Za-z0-9_]*)[^\S\r\n]*=[^\S\r\n]*"
+    rb"(?:\"([^\"]*)\"|'([^']*)'|([^\r\n]*?))[^\S\r\n]*$",
+    re.M,
+)
+
+
+def load_env_file(env_path):
+    """Parse KEY=VALUE lines from a .env file into a dict.
+
+    One compiled-regex pass over the raw bytes instead of per-line
+    strip/startswith/split work — and quoted values keep any '=' inside.
+    """
+    with open(env_path, "rb") as fh:
+        content = fh.read()
+    return {
+        m.group(1).decode(): next(
+            g for g in (m.group(2), m.group(3), m.group(4)) if g is not None
+        ).decode(errors="replace")
+        for m in ENV_RE.finditer(content)
+    }
+
+
+# =====================================================
+# Scanners
+# =====================================================
+# Per-cache-key asyncio locks so concurrent identical bandit scans coalesce
+# in-process (bandit runs on the loop now, so flock would block it).
+_inflight_locks = {}
+
+
+async def run_bandit(project_path, scan_id):
+    sha256 = SCAN_STATE[scan_id].sha256
+    if not sha256:
+        return await _bandit_scan(project_path)
+
+    key = f"bandit-{BANDIT_VERSION}-{sha256}"
+    lock = _inflight_locks.setdefault(key, asyncio.Lock())
     try:
-        bandit_json = json.loads(cleaned_output)
-    except json.JSONDecodeError:
-        bandit_json = {
-            "error": "Bandit failed to produce valid JSON",
-            "raw_output": raw_output
-        }
+        async with lock:
+            hit = await asyncio.to_thread(_cache_get, key)
+            if hit is not None:
+                return hit
+            result = await _bandit_scan(project_path)
+            if not (isinstance(result, dict) and "error" in result):
+                await asyncio.to_thread(_cache_put, key, result)
+            return result
+    finally:
+        _inflight_locks.pop(key, None)
+
+
+def _bandit_scan_kernel(project_path):
+    """Run bandit in-process via its API. Executes in the CPU pool.
 
-    # Build severity summary
+    No interpreter fork, no plugin re-import, no JSON round trip through a
+    pipe — the issue list comes back as Python objects, serialized once into
+    the same shape the CLI's -f json output had.
+    """
+    from bandit.core import config as b_config
+    from bandit.core import manager as b_manager
+
+    mgr = b_manager.BanditManager(b_config.BanditConfig(), "file")
+    mgr.discover_files([project_path], recursive=True, excluded_paths=BANDIT_SKIP_DIRS)
+    mgr.run_tests()
+
+    results = []
     summary = {"HIGH": 0, "MEDIUM": 0, "LOW": 0}
 
-    if "results" in bandit_json:
-        for issue in bandit_json["results"]:
-            severity = issue.get("issue_severity", "LOW")
-            if severity in summary:
-                summary[severity] += 1
+    for issue in mgr.get_issue_list():
+        severity = str(issue.severity)
+        if severity in summary:
+            summary[severity] += 1
+        results.append({
+            "filename": issue.fname,
+            "line_number": issue.lineno,
+            "line_range": list(issue.linerange or []),
+            "test_name": issue.test,
+            "test_id": issue.test_id,
+            "issue_severity": severity,
+            "issue_confidence": str(issue.confidence),
+            "issue_text": issue.text,
+        })
+
+    return {"results": results, "summary_counts": summary}
+
+
+async def _bandit_scan(project_path):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(CPU_POOL, _bandit_scan_kernel, project_path)
 
-    bandit_json["summary_counts"] = summary
-    results["bandit"] = bandit_json
 
+def run_gitleaks(project_path, scan_id):
+    sha256 = SCAN_STATE[scan_id].sha256
+    if sha256:
+        key = f"gitleaks-{_image_key('zricethezav/gitleaks:latest')}-{sha256}"
+        return _cached(key, lambda: _gitleaks_scan(project_path))
+    return _gitleaks_scan(project_path)
 
-    # =====================================================
-    # 2️⃣ Run Gitleaks via Docker
-    # =====================================================
+
+def _iter_source_files(project_path):
+    for root, dirs, files in os.walk(project_path):
+        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+        for f in files:
+            yield os.path.join(root, f)
+
+
+def _gitleaks_scan_stdin(project_path):
+    """Pipe file contents straight into gitleaks over its exec socket.
+
+    The worker never touches the bind mount this way — no second directory
+    walk and no per-file open(2) inside the container. The trade-off of
+    --pipe is that findings lose per-file attribution, which is why the
+    mounted-dir scan stays around as the fallback (and for trivy/bandit,
+    which need random access to a real tree).
+    """
+    client = _pick_client()
+    worker = _ensure_worker("gitleaks", client)
+
+    # -r /dev/stdout is required: gitleaks v8 only writes the report when
+    # given a report path; -f alone logs findings to stderr and emits
+    # nothing on stdout.
+    exec_id = client.api.exec_create(
+        worker.id,
+        ["gitleaks", "detect", "--pipe", "-f", "json", "-r", "/dev/stdout"],
+        stdin=True,
+        stdout=True,
+        stderr=False,
+    )["Id"]
+    sock = client.api.exec_start(exec_id, socket=True)
+    raw = sock._sock if hasattr(sock, "_sock") else sock
+
+    out = bytearray()
     try:
-        gitleaks_output = docker_client.containers.run(
-            "zricethezav/gitleaks:latest",
+        for path in _iter_source_files(project_path):
+            with open(path, "rb") as fh:
+                while True:
+                    chunk = fh.read(1 << 20)
+                    if not chunk:
+                        break
+                    raw.sendall(chunk)
+            raw.sendall(b"\n")
+        raw.shutdown(socket.SHUT_WR)
+
+        for stream_id, data in frames_iter(sock, tty=False):
+            if stream_id == 1:  # stdout
+                out.extend(data)
+    finally:
+        sock.close()
+
+    # 1 means leaks found (still a valid report); anything else non-zero
+    # is a real failure and must trigger the mounted-dir fallback
+    code = client.api.exec_inspect(exec_id).get("ExitCode")
+    if code not in (0, 1):
+        raise RuntimeError(f"gitleaks --pipe exited with code {code}")
+
+    return _loads_maybe_offload(bytes(out)) if out else {}
+
+
+def _gitleaks_scan(project_path):
+    try:
+        return _gitleaks_scan_stdin(project_path)
+    except Exception:
+        pass
+
+    scan_dir = os.path.relpath(project_path, UPLOAD_DIR)
+    try:
+        code, output = _worker_exec(
+            "gitleaks",
             [
+                "gitleaks",
                 "detect",
-                "-s", "/scan",
-                "-f", "json"
+                "-s", f"/uploads/{scan_dir}",
+                "-c", "/uploads/gitleaks.toml",
+                "-f", "json",
+                "-r", "/dev/stdout",
             ],
-            volumes={
-                project_path: {"bind": "/scan", "mode": "ro"}
-            },
-            remove=True,
-            stdout=True,
-            stderr=True
         )
-
-        gitleaks_json = json.loads(gitleaks_output.decode())
-
+        # gitleaks exits 1 when it finds leaks — that is a valid report
+        if code not in (0, 1):
+            return {"error": f"gitleaks exited with code {code}"}
+        return _loads_maybe_offload(output) if output else {}
     except Exception as e:
-        gitleaks_json = {"error": str(e)}
+        return {"error": str(e)}
 
-    results["gitleaks"] = gitleaks_json
 
+def run_trivy(project_path, scan_id):
+    sha256 = SCAN_STATE[scan_id].sha256
+    if sha256:
+        key = f"trivy-{_image_key('aquasec/trivy:latest')}-{sha256}"
+        return _cached(key, lambda: _trivy_scan(project_path))
+    return _trivy_scan(project_path)
 
-    # =====================================================
-    # 3️⃣ Run Trivy via Docker
-    # =====================================================
+
+def _trivy_scan(project_path):
+    scan_dir = os.path.relpath(project_path, UPLOAD_DIR)
     try:
-        trivy_output = docker_client.containers.run(
-            "aquasec/trivy:latest",
+        code, output = _worker_exec(
+            "trivy",
             [
+                "trivy",
                 "fs",
                 "--security-checks", "vuln,config",
-                "/scan",
-                "--format", "json"
+                "--skip-dirs", SCAN_SKIP_DIRS,
+                f"/uploads/{scan_dir}",
+                "--format", "json",
             ],
+        )
+        if code != 0:
+            return {"error": f"trivy exited with code {code}"}
+        return _loads_maybe_offload(output) if output else {}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# =====================================================
+# DAST (build the project, boot it, run ZAP against it)
+# =====================================================
+# Injected into target Dockerfiles that declare no HEALTHCHECK, so we get a
+# health_status event the moment the service answers instead of guessing.
+_HEALTHCHECK_LINE = (
+    "HEALTHCHECK --interval=1s --timeout=1s --retries=30 "
+    "CMD sh -c 'for p in 80 8000 5000 3000; do curl -fsS http://localhost:$p && exit 0; done; exit 1'\n"
+)
+
+
+def _dockerfile_for_build(target_path):
+    """Return the Dockerfile name to build, adding a healthcheck if absent.
+
+    Images without curl simply never report healthy and the TCP-probe
+    fallback takes over, so the injection is strictly best-effort.
+    """
+    try:
+        with open(os.path.join(target_path, "Dockerfile")) as fh:
+            content = fh.read()
+    except OSError:
+        return "Dockerfile"
+
+    if "HEALTHCHECK" in content:
+        return "Dockerfile"
+
+    sidecar = "Dockerfile.dast"
+    with open(os.path.join(target_path, sidecar), "w") as fh:
+        fh.write(content + "\n" + _HEALTHCHECK_LINE)
+    return sidecar
+
+
+# Layers of built target images are reusable across scans of the same
+# project: each successful build is also tagged dast_cache:<hash of the
+# Dockerfile + dependency manifests> and that tag is fed back through
+# cache_from, so unchanged FROM/apt/pip layers are never rebuilt. A small
+# LRU of cache tags keeps the daemon's image store bounded.
+DAST_CACHE_LIMIT = int(os.environ.get("DAST_CACHE_LIMIT", 16))
+_dast_cache_tags = OrderedDict()
+_dast_cache_lock = threading.Lock()
+
+_DAST_CACHE_INPUTS = ("Dockerfile", "requirements.txt", "package.json", "go.sum")
+
+
+def _dast_cache_key(target_path):
+    h = hashlib.sha256()
+    for name in _DAST_CACHE_INPUTS:
+        try:
+            with open(os.path.join(target_path, name), "rb") as fh:
+                h.update(fh.read())
+        except OSError:
+            continue
+    return h.hexdigest()[:16]
+
+
+# Per-scan image tags are not deleted in the scan path — tearing down a
+# layer graph blocks the daemon for seconds per target. Builds carry
+# labels instead and a background sweeper untags stale per-scan images.
+DAST_IMAGE_TTL = int(os.environ.get("DAST_IMAGE_TTL", 3600))
+
+
+def _sweep_stale_images():
+    """Untag per-scan dast- images older than the TTL every five minutes."""
+    while True:
+        time.sleep(300)
+        cutoff = time.time() - DAST_IMAGE_TTL
+        try:
+            for image in docker_client.images.list(filters={"label": "scanner.managed"}):
+                ts = image.labels.get("scanner.ts")
+                if ts is None or float(ts) > cutoff:
+                    continue
+                for tag in image.tags:
+                    if tag.startswith("dast-") and not tag.startswith("dast_cache:"):
+                        try:
+                            docker_client.images.remove(tag)
+                        except Exception:
+                            pass
+        except Exception:
+            pass
+
+
+threading.Thread(target=_sweep_stale_images, daemon=True).start()
+
+
+def _dast_cache_note(client, tag):
+    """Mark a cache tag most-recently-used; evict the stalest past the cap."""
+    with _dast_cache_lock:
+        _dast_cache_tags.pop(tag, None)
+        _dast_cache_tags[tag] = time.time()
+        evicted = []
+        while len(_dast_cache_tags) > DAST_CACHE_LIMIT:
+            evicted.append(_dast_cache_tags.popitem(last=False)[0])
+    for old in evicted:
+        try:
+            client.images.remove(old)
+        except Exception:
+            pass
+
+
+def _probe_port(host, ports=COMMON_WEB_PORTS, timeout=0.25):
+    """Probe every candidate port at once with non-blocking connects.
+
+    One SYN per port fired together, then a single select for writability;
+    the first socket whose SO_ERROR is clear wins. A target listening only
+    on the last candidate costs one timeout, not one per port.
+    """
+    sel = selectors.DefaultSelector()
+    socks = []
+    try:
+        for port in ports:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setblocking(False)
+            socks.append(s)
+            try:
+                s.connect((host, port))
+            except BlockingIOError:
+                pass
+            except OSError:
+                continue
+            sel.register(s, selectors.EVENT_WRITE, port)
+
+        deadline = time.monotonic() + timeout
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                sel.unregister(key.fileobj)
+                if err == 0:
+                    return key.data
+        return None
+    finally:
+        for s in socks:
+            s.close()
+        sel.close()
+
+
+# Log lines that typically mean "the server is up" — a cheap readiness
+# signal for images without a healthcheck.
+_READY_LOG_RE = re.compile(rb"listen|running|started|bind", re.I)
+
+
+def _watch_logs_for_ready(container, ready, stop_at):
+    """Set ready when the container logs a line that smells like startup."""
+    try:
+        for chunk in container.logs(stream=True, follow=True):
+            if ready.is_set() or time.monotonic() > stop_at:
+                return
+            if _READY_LOG_RE.search(chunk):
+                ready.set()
+                return
+    except Exception:
+        pass
+
+
+def _watch_health_events(container, ready, deadline):
+    """Set ready when the daemon reports the container healthy."""
+    try:
+        events = container.client.events(
+            decode=True,
+            filters={"container": container.id, "event": "health_status"},
+            until=int(time.time() + deadline) + 1,
+        )
+        for event in events:
+            if ready.is_set():
+                return
+            if "healthy" in event.get("status", ""):
+                ready.set()
+                return
+    except Exception:
+        pass
+
+
+def _wait_until_ready(container, host, deadline=30.0):
+    """Wait for the target to accept connections; return the open port.
+
+    TCP probing with exponential backoff (50ms doubling to 1s) starts
+    immediately; health_status events and the log watcher run in side
+    threads that wake the prober early via the shared Event. Nothing ever
+    blocks ahead of the probe loop — the injected curl healthcheck can
+    never pass on images without curl, so waiting on it serially would
+    eat the whole deadline for exactly the images that need the probe.
+    """
+    start = time.monotonic()
+    ready = threading.Event()
+    has_health = bool(container.attrs["State"].get("Health"))
+
+    if has_health:
+        threading.Thread(
+            target=_watch_health_events,
+            args=(container, ready, deadline),
+            daemon=True,
+        ).start()
+    threading.Thread(
+        target=_watch_logs_for_ready,
+        args=(container, ready, start + deadline),
+        daemon=True,
+    ).start()
+
+    delay = 0.05
+    while time.monotonic() - start < deadline:
+        port = _probe_port(host)
+        if port is not None:
+            return port
+        # sleep the backoff interval, but wake immediately when a watcher
+        # sees a healthy event or a startup-looking log line
+        if ready.wait(delay):
+            ready.clear()
+            port = _probe_port(host, timeout=1.0)
+            if port is not None:
+                return port
+        delay = min(delay * 2, 1.0)
+    return None
+def _scan_one_target(project_path, scan_id, network_name, idx, target_path):
+    """Build, boot and ZAP-scan a single DAST target. Thread-safe."""
+    state = SCAN_STATE[scan_id]
+    client = _pick_client()
+
+    label = os.path.relpath(target_path, project_path)
+    image_tag = f"dast-{scan_id[:8]}-{idx}"
+    container_name = f"dast-target-{idx}-{scan_id[:8]}"
+    container = None
+
+    if state.cancelled:
+        return label, {"skipped": "scan cancelled"}
+
+    try:
+        # Build the target image (with an injected healthcheck if needed),
+        # priming the layer cache from the previous build of this project.
+        # The context tar is built here, with the junk directories already
+        # excluded, so the daemon never receives node_modules/.git at all.
+        dockerfile = _dockerfile_for_build(target_path)
+        cache_tag = f"dast_cache:{_dast_cache_key(target_path)}"
+        context = docker.utils.tar(target_path, exclude=list(IGNORE_DIRS))
+        try:
+            client.images.build(
+                fileobj=context,
+                custom_context=True,
+                dockerfile=dockerfile,
+                tag=image_tag,
+                cache_from=[cache_tag],
+                labels={
+                    "scanner.managed": "true",
+                    "scanner.scan_id": scan_id,
+                    "scanner.ts": str(int(time.time())),
+                },
+                rm=True,
+            )
+        finally:
+            context.close()
+        try:
+            client.images.get(image_tag).tag(*cache_tag.split(":"))
+            _dast_cache_note(client, cache_tag)
+        except Exception:
+            pass
+
+        # Load a .env file if the target ships one
+        env = {}
+        env_path = find_env_file(target_path)
+        if env_path:
+            env = load_env_file(env_path)
+
+        container = client.containers.run(
+            image_tag,
+            detach=True,
+            name=container_name,
+            network=network_name,
+            environment=env,
+        )
+        with _state_lock:
+            state.containers.append(container.id)
+
+        # one refresh to learn the container's network address; readiness
+        # itself is event-driven below, no fixed boot pause
+        container.reload()
+
+        host = container.attrs["NetworkSettings"]["Networks"][network_name]["IPAddress"]
+
+        # Wait until the service accepts connections
+        port = _wait_until_ready(container, host)
+
+        if port is None:
+            return label, {"error": "Service never became reachable"}
+
+        # Run the ZAP baseline scan against the running container
+        zap_dir = os.path.join(project_path, f"zap-{idx}")
+        os.makedirs(zap_dir, exist_ok=True)
+
+        client.containers.run(
+            "owasp/zap2docker-stable",
+            [
+                "zap-baseline.py",
+                "-t", f"http://{container_name}:{port}",
+                "-J", "report.json",
+                "-I",
+            ],
+            network=network_name,
             volumes={
-                project_path: {"bind": "/scan", "mode": "ro"}
+                zap_dir: {"bind": "/zap/wrk", "mode": "rw"}
             },
             remove=True,
             stdout=True,
-            stderr=True
+            stderr=True,
         )
 
-        trivy_json = json.loads(trivy_output.decode())
+        report_path = os.path.join(zap_dir, "report.json")
+        if os.path.exists(report_path):
+            with open(report_path, "rb") as fh:
+                return label, _loads_maybe_offload(fh.read())
+        return label, {"error": "ZAP produced no report"}
+
+    finally:
+        if container is not None:
+            try:
+                container.stop(timeout=5)
+                container.remove(force=True)
+            except Exception:
+                pass
+        # the per-scan tag is deliberately left behind: the background
+        # sweeper untags it after DAST_IMAGE_TTL, off the hot path
+
+
+def run_dast(project_path, scan_id):
+    project_type, _ = detect_project_type(project_path)
+
+    if project_type == "unknown":
+        return {"skipped": "No Dockerfile or docker-compose.yml found"}
+
+    targets = detect_all_targets(project_path)
+    if not targets:
+        return {"skipped": "No buildable targets found"}
+
+    client = _pick_client()
+    network_name = f"dast-net-{scan_id[:8]}"
+    network = client.networks.create(network_name)
+    results = {}
+
+    # Targets are independent build+boot+ZAP pipelines; run them on a
+    # bounded pool so total DAST time approaches max(target) not sum.
+    # Unique per-target names/aliases keep ZAP -> target resolution correct,
+    # and each future is fail-isolated so one broken Dockerfile cannot
+    # abort the rest.
+    try:
+        with ThreadPoolExecutor(max_workers=min(4, len(targets))) as executor:
+            futures = {
+                executor.submit(
+                    _scan_one_target, project_path, scan_id, network_name, idx, target_path
+                ): target_path
+                for idx, target_path in enumerate(targets)
+            }
+            for future in as_completed(futures):
+                try:
+                    label, result = future.result()
+                    results[label] = result
+                except Exception as e:
+                    label = os.path.relpath(futures[future], project_path)
+                    results[label] = {"error": str(e)}
+    finally:
+        try:
+            network.remove()
+        except Exception:
+            pass
+
+    return results
+
+
+# =====================================================
+# Scoring
+# =====================================================
+# Exact-key severity normalization: one dict lookup per finding instead of
+# str()/lower() plus three substring searches. CRITICAL folds into HIGH.
+_SEV_MAP = {
+    "HIGH": "HIGH", "High": "HIGH", "high": "HIGH",
+    "CRITICAL": "HIGH", "Critical": "HIGH", "critical": "HIGH",
+    "MEDIUM": "MEDIUM", "Medium": "MEDIUM", "medium": "MEDIUM",
+    "LOW": "LOW", "Low": "LOW", "low": "LOW",
+}
+
+SEV_WEIGHT = {"HIGH": 10, "MEDIUM": 5, "LOW": 2}
+
+# Fallback for free-text severities like ZAP's "High (Medium)" riskdesc,
+# where the exact-key map cannot apply.
+RISK_RE = re.compile(r"high|medium|low", re.I)
+
+
+def compute_security_score(results):
+    """Derive a 0-100 score from all findings across every tool.
+
+    Tallies normalized severities into a Counter in one pass per tool and
+    scores with a single arithmetic expression at the end — no per-finding
+    string munging.
+    """
+    counts = Counter()
+
+    for name, data in results.items():
+        if not data:
+            continue
+
+        # bandit-style results
+        if isinstance(data, dict) and "results" in data:
+            counts.update(
+                _SEV_MAP.get(finding.get("issue_severity"))
+                for finding in data["results"]
+            )
+        elif isinstance(data, dict) and "summary_counts" in data:
+            # oversized bandit report reduced to severity tallies
+            for sev, n in data["summary_counts"].items():
+                counts[sev] += n
+
+        # trivy-style results
+        if isinstance(data, dict) and "Results" in data:
+            counts.update(
+                _SEV_MAP.get(vuln.get("Severity"))
+                for result in data["Results"] or []
+                for vuln in result.get("Vulnerabilities") or []
+            )
+
+        # gitleaks findings (every leak counts as high)
+        if isinstance(data, list):
+            counts["HIGH"] += len(data)
+
+        # ZAP reports, keyed by target; riskdesc looks like "High (Medium)"
+        if isinstance(data, dict) and name == "dast":
+            counts.update(
+                m.group(0).upper()
+                for target_report in data.values()
+                if isinstance(target_report, dict)
+                for site in target_report.get("site") or []
+                for alert in site.get("alerts") or []
+                if (m := RISK_RE.search(str(alert.get("riskdesc", ""))))
+            )
+
+    counts.pop(None, None)
+    score = 100 - sum(SEV_WEIGHT[sev] * n for sev, n in counts.items())
+    return max(score, 0)
+
+
+# =====================================================
+# PDF report
+# =====================================================
+# Style objects never change between requests — build them once at import
+# instead of re-running getSampleStyleSheet per download.
+_PDF_STYLES = getSampleStyleSheet()
+_PDF_TITLE = ParagraphStyle(
+    "ReportTitle", parent=_PDF_STYLES["Title"], spaceAfter=12
+)
+_PDF_HEADING = _PDF_STYLES["Heading2"]
+_PDF_CODE = _PDF_STYLES["Code"]
+
+
+def generate_pdf_report(scan_id, state, results, path):
+    """Render the stored scan results to a PDF at path."""
+    doc = SimpleDocTemplate(path, pagesize=A4, title=f"Scan {scan_id[:8]}")
+
+    story = [Paragraph("Security Scan Report", _PDF_TITLE)]
+    if state.score is not None:
+        story.append(Paragraph(f"Security score: {state.score}/100", _PDF_HEADING))
+        story.append(Spacer(1, 12))
+
+    for name in PIPELINE_STEPS:
+        if name not in results:
+            continue
+        story.append(Paragraph(name, _PDF_HEADING))
+        text = orjson.dumps(results[name], option=orjson.OPT_INDENT_2).decode()
+        # Preformatted renders verbatim — no XML mini-parse per block
+        story.append(Preformatted(text, _PDF_CODE))
+        story.append(Spacer(1, 12))
+
+    doc.build(story)
+    return path
+
+
+# =====================================================
+# Pipeline
+# =====================================================
+def _store_result(project_path, name, result):
+    """Persist a step result next to the extracted tree, return its path.
+
+    Large scanner JSON lives on disk, not in SCAN_STATE — status polling
+    only ever copies lightweight metadata.
+    """
+    path = os.path.join(project_path, f"{name}.json")
+    with open(path, "wb") as fh:
+        fh.write(orjson.dumps(result))
+    return path
+
 
+def _result_paths(scan_id):
+    with _state_lock:
+        if scan_id not in SCAN_STATE:
+            return {}
+        return {
+            name: step.result_path
+            for name, step in SCAN_STATE[scan_id].steps.items()
+            if step.result_path
+        }
+
+
+def _read_results(paths):
+    # plain orjson.loads here: this already runs off the event loop (in
+    # the CPU pool for scoring, in a worker thread for the endpoints), so
+    # a second offload hop would only add pickling
+    results = {}
+    for name, path in paths.items():
+        try:
+            with open(path, "rb") as fh:
+                results[name] = orjson.loads(fh.read())
+        except (OSError, orjson.JSONDecodeError):
+            results[name] = {"error": "stored result unavailable"}
+    return results
+
+
+def _load_results(scan_id):
+    """Read every stored step result back from disk."""
+    return _read_results(_result_paths(scan_id))
+
+
+def _score_results(paths):
+    """Parse + score stored results; pure, so it ships to the CPU pool.
+
+    Only the path dict crosses the process boundary — the child reads and
+    parses the big JSON itself, so nothing large is ever pickled.
+    """
+    return compute_security_score(_read_results(paths))
+
+
+async def _record_step(scan_id, name, awaitable, project_path):
+    """Run one pipeline step and record its outcome in SCAN_STATE."""
+    state = SCAN_STATE[scan_id]
+    step = state.steps[name]
+
+    with _state_lock:
+        step.status = "running"
+        step.start = time.time()
+
+    try:
+        result = await awaitable
+        status = "finished"
+    except Exception as e:
+        result = {"error": str(e)}
+        status = "error"
+
+    result_path = await asyncio.to_thread(_store_result, project_path, name, result)
+
+    with _state_lock:
+        step.end = time.time()
+        step.duration = round(step.end - step.start, 2)
+        step.result_path = result_path
+        step.status = status
+
+
+async def run_pipeline(scan_id, zip_source, project_path):
+    state = SCAN_STATE[scan_id]
+    state.current = "extracting"
+
+    # Extract ZIP safely. Any failure must finalize the state — an
+    # exception escaping here would kill the task and leave the scan
+    # stuck at "extracting" with the UI polling forever.
+    try:
+        await asyncio.to_thread(extract_zip, zip_source, project_path)
+    except zipfile.BadZipFile:
+        state.current = "error"
+        state.error = "Invalid ZIP file"
+        return
     except Exception as e:
-        trivy_json = {"error": str(e)}
+        state.current = "error"
+        state.error = f"Extraction failed: {e}"
+        return
+
+    # Static scanners are independent and read the tree read-only,
+    # so fan them out as tasks and wait for the slowest one. bandit runs
+    # in-process in the CPU pool; the Docker SDK calls are blocking
+    # and go through worker threads.
+    state.current = "static-scan"
+
+    static_tasks = [
+        _record_step(scan_id, "bandit", run_bandit(project_path, scan_id), project_path),
+        _record_step(scan_id, "gitleaks", asyncio.to_thread(run_gitleaks, project_path, scan_id), project_path),
+        _record_step(scan_id, "trivy", asyncio.to_thread(run_trivy, project_path, scan_id), project_path),
+    ]
+
+    for completed in asyncio.as_completed(static_tasks):
+        await completed
+        with _state_lock:
+            state.progress += 25
+
+    static_ok = all(
+        state.steps[name].status == "finished"
+        for name in ("bandit", "gitleaks", "trivy")
+    )
 
-    results["trivy"] = trivy_json
+    # DAST stays sequential: it needs the extracted tree and the
+    # static phase verdict, and it is heavy on Docker resources.
+    if static_ok and not state.cancelled:
+        state.current = "dast"
+        await _record_step(scan_id, "dast", asyncio.to_thread(run_dast, project_path, scan_id), project_path)
+    else:
+        with _state_lock:
+            state.steps["dast"].status = "skipped"
 
+    loop = asyncio.get_running_loop()
+    score = await loop.run_in_executor(CPU_POOL, _score_results, _result_paths(scan_id))
+
+    with _state_lock:
+        state.progress = 100
+        state.score = score
+        state.current = "cancelled" if state.cancelled else "finished"
+
+
+# -----------------------------
+# Startup & readiness
+# -----------------------------
+@app.on_event("startup")
+async def prewarm_images():
+    # Pull in the background so the app binds its port immediately;
+    # /healthz reports 503 until the images have landed.
+    threading.Thread(target=_pull_scanner_images, daemon=True).start()
 
-    # =====================================================
-    # Render Results
-    # =====================================================
+
+@app.get("/healthz")
+def healthz():
+    if not _images_ready.is_set():
+        return JSONResponse({"status": "warming up"}, status_code=503)
+    return {"status": "ok"}
+
+
+# -----------------------------
+# Home Page
+# -----------------------------
+@app.get("/", response_class=HTMLResponse)
+async def home(request: Request):
     return templates.TemplateResponse(
         "index.html",
-        {
-            "request": request,
-            "results": results
-        }
+        {"request": request}
     )
+
+
+# -----------------------------
+# Scan Endpoints
+# -----------------------------
+async def _receive_upload(request, scan_dir):
+    """Stream the multipart body straight to disk, hashing as we go.
+
+    FastAPI's UploadFile would first spool the part to a temp file, which we
+    would then have to copy to code.zip — two full passes over the bytes.
+    Driving the multipart parser ourselves writes each chunk exactly once
+    and produces the SHA-256 for free. The upload form posts a single file
+    field, so every part-data chunk belongs to the archive.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart file upload")
+
+    digest = hashlib.sha256()
+    sink = io.BytesIO()
+    spilled = None  # set to a NamedTemporaryFile once the cap is crossed
+
+    def on_part_data(data, start, end):
+        nonlocal sink, spilled
+        chunk = data[start:end]
+        digest.update(chunk)
+        if spilled is None and sink.tell() + len(chunk) > SMALL_UPLOAD_LIMIT:
+            # too big for memory — spill what we have and stream the rest
+            spilled = tempfile.NamedTemporaryFile(dir=scan_dir, delete=False)
+            spilled.write(sink.getbuffer())
+            sink = spilled
+        sink.write(chunk)
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {"on_part_data": on_part_data},
+    )
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+    except Exception:
+        if spilled is not None:
+            spilled.close()
+            os.unlink(spilled.name)
+        raise HTTPException(status_code=400, detail="Malformed upload")
+
+    if spilled is None:
+        # small upload: hand the archive bytes straight to extraction,
+        # never touching disk
+        return sink.getvalue(), digest.hexdigest()
+
+    spilled.close()
+    zip_path = os.path.join(scan_dir, "code.zip")
+    os.replace(spilled.name, zip_path)
+    return zip_path, digest.hexdigest()
+
+
+@app.post("/scan")
+async def start_scan(request: Request):
+
+    # Create unique scan folder
+    scan_id = str(uuid.uuid4())
+    project_path = os.path.join(UPLOAD_DIR, scan_id)
+    os.makedirs(project_path, exist_ok=True)
+
+    # Receive the archive (one pass: spool + hash); small uploads come
+    # back as bytes and never touch disk
+    zip_source, sha256 = await _receive_upload(request, project_path)
+
+    init_scan(scan_id, project_path, sha256=sha256)
+
+    # Run the pipeline as a background task; the UI polls /scan-status.
+    # A Task costs a few KB versus ~8 MB of stack for a dedicated thread.
+    task = asyncio.create_task(run_pipeline(scan_id, zip_source, project_path))
+    _TASKS[scan_id] = task
+    task.add_done_callback(lambda _: _TASKS.pop(scan_id, None))
+
+    return JSONResponse({"scan_id": scan_id})
+
+
+@app.get("/scan-status/{scan_id}")
+async def status(scan_id: str):
+    # Pure in-memory work, so run it on the event loop itself instead of
+    # burning a threadpool slot per poll. Snapshot under the lock so the
+    # serializer never races the pipeline, then encode with msgspec and
+    # return a raw Response — no jsonable_encoder walk, no stdlib json.
+    now = time.time()
+    with _state_lock:
+        if scan_id not in SCAN_STATE:
+            raise HTTPException(status_code=404, detail="Unknown scan id")
+        state = SCAN_STATE[scan_id]
+        steps = {}
+        for name, step in state.steps.items():
+            duration = step.duration
+            if step.status == "running" and step.start:
+                duration = round(now - step.start, 2)
+            steps[name] = StepState(
+                status=step.status,
+                start=step.start,
+                end=step.end,
+                duration=duration,
+                result_path=step.result_path,
+            )
+        view = StatusView(
+            current=state.current,
+            progress=state.progress,
+            sha256=state.sha256,
+            score=state.score,
+            error=state.error,
+            cancelled=state.cancelled,
+            steps=steps,
+        )
+
+    return Response(msgspec.json.encode(view), media_type="application/json")
+
+
+@app.get("/scan-results/{scan_id}")
+async def scan_results(scan_id: str):
+    with _state_lock:
+        if scan_id not in SCAN_STATE:
+            raise HTTPException(status_code=404, detail="Unknown scan id")
+
+    # the result blobs live on disk — read them off the loop
+    return await asyncio.to_thread(_load_results, scan_id)
+
+
+@app.get("/download-pdf/{scan_id}")
+async def download_pdf(scan_id: str):
+    with _state_lock:
+        if scan_id not in SCAN_STATE:
+            raise HTTPException(status_code=404, detail="Unknown scan id")
+        state = SCAN_STATE[scan_id]
+
+    # Results are immutable once the scan has finalized, so a report
+    # already on disk is still correct — only render when it is missing
+    # or the scan is somehow still moving.
+    pdf_path = os.path.join(state.project_path, "report.pdf")
+    finalized = state.current in ("finished", "error", "cancelled")
+    if not (finalized and os.path.exists(pdf_path)):
+        # rendering is genuinely blocking (disk reads + reportlab layout)
+        results = await asyncio.to_thread(_load_results, scan_id)
+        await asyncio.to_thread(generate_pdf_report, scan_id, state, results, pdf_path)
+
+    # FileResponse serves via sendfile(2) — the PDF bytes never pass
+    # through Python on the way out
+    return FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        filename=f"scan-{scan_id[:8]}.pdf",
+    )
+
+
+@app.post("/cancel/{scan_id}")
+async def cancel(scan_id: str):
+    with _state_lock:
+        if scan_id not in SCAN_STATE:
+            raise HTTPException(status_code=404, detail="Unknown scan id")
+        state = SCAN_STATE[scan_id]
+        state.cancelled = True
+        containers = list(state.containers)
+
+    def stop_containers():
+        for container_id in containers:
+            try:
+                docker_client.containers.get(container_id).stop(timeout=5)
+            except Exception:
+                pass
+
+    # Docker stop calls block; keep them off the event loop
+    await asyncio.to_thread(stop_containers)
+
+    return {"cancelled": scan_id}